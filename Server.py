@@ -1,20 +1,21 @@
-from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Query
 from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.write_concern import WriteConcern
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import asyncio
-import json
-import random
-import math
-import pandas as pd
+import time
+import orjson
+import numpy as np
+import csv
 import io
 from typing import AsyncGenerator
 
@@ -26,6 +27,9 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Telemetry is lossy-tolerant time-series data, so inserts are fire-and-forget
+telemetry_coll = db.get_collection("telemetry", write_concern=WriteConcern(w=0))
+
 # Create the main app without a prefix
 app = FastAPI(title="Connected Car Telemetry Dashboard", version="1.0.0")
 
@@ -33,23 +37,56 @@ app = FastAPI(title="Connected Car Telemetry Dashboard", version="1.0.0")
 api_router = APIRouter(prefix="/api")
 
 # WebSocket connection manager
+CLIENT_QUEUE_SIZE = 4  # pending frames per client before the oldest is coalesced into the newest
+
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        # Each client gets a bounded outbox drained by its own writer task,
+        # so a slow client only falls behind itself
+        self.active_connections: Dict[WebSocket, asyncio.Queue] = {}
+        self.writer_tasks: Dict[WebSocket, asyncio.Task] = {}
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.active_connections[websocket] = queue
+        self.writer_tasks[websocket] = asyncio.create_task(self._write(websocket, queue))
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        self.active_connections.pop(websocket, None)
+        writer_task = self.writer_tasks.pop(websocket, None)
+        if writer_task:
+            writer_task.cancel()
+
+    async def _write(self, websocket: WebSocket, queue: asyncio.Queue):
+        try:
+            while True:
+                _, payload = await queue.get()
+                await websocket.send_text(payload)
+        except Exception:
+            self.disconnect(websocket)
+
+    def send(self, websocket: WebSocket, message: dict):
+        queue = self.active_connections.get(websocket)
+        if queue:
+            self._enqueue(queue, message, orjson.dumps(message).decode())
 
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(json.dumps(message))
-            except:
-                pass
+        # Serialize once (orjson handles datetimes natively) and queue for every client
+        payload = orjson.dumps(message).decode()
+        for queue in self.active_connections.values():
+            self._enqueue(queue, message, payload)
+
+    def _enqueue(self, queue: asyncio.Queue, message: dict, payload: str):
+        if queue.full():
+            # Client is behind: coalesce every pending frame into the newest one.
+            # Its telemetry supersedes theirs; alert events are kept in arrival order
+            pending = [queue.get_nowait()[0] for _ in range(queue.qsize())]
+            dropped_alerts = [alert for frame in pending for alert in frame.get("alerts", [])]
+            if dropped_alerts:
+                message = {**message, "alerts": dropped_alerts + message.get("alerts", [])}
+                payload = orjson.dumps(message).decode()
+        queue.put_nowait((message, payload))
 
 manager = ConnectionManager()
 
@@ -70,7 +107,7 @@ class VehicleCreate(BaseModel):
     license_plate: str
 
 class TelemetryData(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    # No separate id: MongoDB's client-generated ObjectId _id identifies each sample
     vehicle_id: str
     speed: float  # km/h
     engine_rpm: float  # RPM
@@ -95,97 +132,269 @@ TELEMETRY_THRESHOLDS = {
     "fuel_level": {"max": 100, "min": 10},  # percentage
     "engine_temperature": {"max": 100, "min": 80}  # Celsius
 }
+ALERT_METRICS = list(TELEMETRY_THRESHOLDS)
+THRESH_MAX = np.array([TELEMETRY_THRESHOLDS[metric]["max"] for metric in ALERT_METRICS], dtype=np.float64)
+THRESH_MIN = np.array([TELEMETRY_THRESHOLDS[metric]["min"] for metric in ALERT_METRICS], dtype=np.float64)
+
+# Repeat an ongoing alert event at most once per cooldown; state is cleared when the metric recovers
+ALERT_COOLDOWN_SECONDS = 60
+_alert_state: Dict[Tuple[str, str], float] = {}  # (vehicle_id, metric) -> last fired epoch
+# Last alert fired for each ongoing breach, sent as a snapshot to newly connected clients
+active_alerts: Dict[Tuple[str, str], TelemetryAlert] = {}
+
+# Decimal places telemetry readings are reported with
+TELEMETRY_PRECISION = {
+    "speed": 1,
+    "engine_rpm": 0,
+    "fuel_level": 1,
+    "engine_temperature": 1,
+    "latitude": 6,
+    "longitude": 6
+}
+
+# Fields returned by read endpoints; documents are served as-is without re-validation
+VEHICLE_PROJECTION = {
+    "_id": 0, "id": 1, "name": 1, "model": 1, "year": 1,
+    "license_plate": 1, "is_active": 1, "created_at": 1
+}
+TELEMETRY_PROJECTION = {
+    "_id": 0, "vehicle_id": 1, "speed": 1, "engine_rpm": 1, "fuel_level": 1,
+    "engine_temperature": 1, "latitude": 1, "longitude": 1, "timestamp": 1
+}
+TELEMETRY_INDEX = [("vehicle_id", 1), ("timestamp", -1)]
+EXPORT_BATCH_SIZE = 1000  # documents per cursor round-trip when streaming CSV exports
+
+# Telemetry write buffer, flushed to MongoDB in batches by flush_loop()
+TELEMETRY_FLUSH_INTERVAL = 2.0  # seconds
+TELEMETRY_FLUSH_SIZE = 1000  # documents
+telemetry_buffer: List[Dict] = []
+telemetry_flush_event = asyncio.Event()
+telemetry_flush_stop = asyncio.Event()
+
+def buffer_telemetry(docs: List[Dict]):
+    """Queue telemetry documents for the next batched insert"""
+    telemetry_buffer.extend(docs)
+    if len(telemetry_buffer) >= TELEMETRY_FLUSH_SIZE:
+        telemetry_flush_event.set()
+
+async def flush_telemetry_buffer():
+    """Write all buffered telemetry documents in a single insert_many"""
+    global telemetry_buffer
+    batch, telemetry_buffer = telemetry_buffer, []
+    if batch:
+        await telemetry_coll.insert_many(batch, ordered=False)
+
+async def flush_loop():
+    """Flush the telemetry buffer periodically or once it reaches TELEMETRY_FLUSH_SIZE"""
+    while not telemetry_flush_stop.is_set():
+        try:
+            await asyncio.wait_for(telemetry_flush_event.wait(), timeout=TELEMETRY_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        telemetry_flush_event.clear()
+        try:
+            await flush_telemetry_buffer()
+        except Exception:
+            logger.exception("Failed to flush telemetry buffer")
 
 # Vehicle simulation state
-vehicle_states: Dict[str, Dict] = {}
-
-def initialize_vehicle_state(vehicle_id: str) -> Dict:
-    """Initialize realistic vehicle telemetry state"""
-    base_lat, base_lng = 37.7749, -122.4194  # San Francisco base coordinates
-    return {
-        "speed": random.uniform(60, 80),
-        "engine_rpm": random.uniform(1500, 2500),
-        "fuel_level": random.uniform(50, 100),
-        "engine_temperature": random.uniform(85, 95),
-        "latitude": base_lat + random.uniform(-0.1, 0.1),
-        "longitude": base_lng + random.uniform(-0.1, 0.1),
-        "direction": random.uniform(0, 360),
-        "last_update": datetime.now(timezone.utc)
-    }
+rng = np.random.default_rng()
+
+class VehicleFleet:
+    """Simulation state for all vehicles as parallel NumPy columns, one row per vehicle"""
+    COLUMNS = ("speed", "engine_rpm", "fuel_level", "engine_temperature",
+               "latitude", "longitude", "direction", "cos_dir", "sin_dir", "last_update")
 
-def simulate_realistic_telemetry(vehicle_id: str, state: Dict) -> TelemetryData:
-    """Generate realistic telemetry data with smooth transitions"""
+    def __init__(self):
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        for column in self.COLUMNS:
+            setattr(self, column, np.empty(0, dtype=np.float64))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, vehicle_id: str):
+        """Initialize realistic vehicle telemetry state"""
+        if vehicle_id in self.rows:
+            return
+        base_lat, base_lng = 37.7749, -122.4194  # San Francisco base coordinates
+        direction = rng.uniform(0, 360)
+        state = {
+            "speed": rng.uniform(60, 80),
+            "engine_rpm": rng.uniform(1500, 2500),
+            "fuel_level": rng.uniform(50, 100),
+            "engine_temperature": rng.uniform(85, 95),
+            "latitude": base_lat + rng.uniform(-0.1, 0.1),
+            "longitude": base_lng + rng.uniform(-0.1, 0.1),
+            "direction": direction,
+            "cos_dir": np.cos(np.radians(direction)),
+            "sin_dir": np.sin(np.radians(direction)),
+            "last_update": datetime.now(timezone.utc).timestamp()
+        }
+        self.rows[vehicle_id] = len(self.ids)
+        self.ids.append(vehicle_id)
+        for column, value in state.items():
+            setattr(self, column, np.append(getattr(self, column), value))
+
+    def remove(self, vehicle_id: str):
+        """Drop a vehicle from the simulation"""
+        row = self.rows.pop(vehicle_id, None)
+        if row is None:
+            return
+        del self.ids[row]
+        for column in self.COLUMNS:
+            setattr(self, column, np.delete(getattr(self, column), row))
+        self.rows = {vid: i for i, vid in enumerate(self.ids)}
+
+    def sync(self, vehicle_ids: List[str]):
+        """Make the simulated rows match the given active vehicles"""
+        active = set(vehicle_ids)
+        for vehicle_id in [vid for vid in self.ids if vid not in active]:
+            self.remove(vehicle_id)
+        for vehicle_id in vehicle_ids:
+            self.add(vehicle_id)
+
+vehicle_fleet = VehicleFleet()
+
+# Active vehicles for the telemetry producer; they change on human timescales,
+# so only re-query after a mutation
+_active_vehicles_cache: List[Dict] = []
+_cache_dirty = True
+
+def invalidate_vehicle_cache():
+    """Force the next get_active_vehicles() call to reload from MongoDB"""
+    global _cache_dirty
+    _cache_dirty = True
+
+async def get_active_vehicles() -> List[Dict]:
+    """Get active vehicles, querying MongoDB only when the cache is dirty"""
+    global _active_vehicles_cache, _cache_dirty
+    while _cache_dirty:
+        # Cleared before the query; a mutation made meanwhile triggers another reload
+        _cache_dirty = False
+        _active_vehicles_cache = await db.vehicles.find(
+            {"is_active": True}, projection=VEHICLE_PROJECTION
+        ).to_list(100)
+    return _active_vehicles_cache
+
+def simulate_batch(fleet: VehicleFleet) -> List[Dict]:
+    """Generate realistic telemetry data with smooth transitions for every vehicle at once"""
+    n = len(fleet)
     current_time = datetime.now(timezone.utc)
-    time_diff = (current_time - state["last_update"]).total_seconds()
+    time_diff = current_time.timestamp() - fleet.last_update
+    
+    # One batched draw per tick: speed noise, RPM noise, turn chance, turn angle
+    draws = rng.uniform(-1, 1, size=(n, 4))
     
     # Speed simulation with traffic patterns
-    speed_change = random.uniform(-5, 5) * time_diff
-    state["speed"] = max(0, min(140, state["speed"] + speed_change))
+    speed_change = draws[:, 0] * 5 * time_diff
+    np.clip(fleet.speed + speed_change, 0, 140, out=fleet.speed)
     
     # RPM correlates with speed
-    target_rpm = state["speed"] * 35 + random.uniform(-200, 200)
-    state["engine_rpm"] = max(800, min(6500, target_rpm))
+    target_rpm = fleet.speed * 35 + draws[:, 1] * 200
+    np.clip(target_rpm, 800, 6500, out=fleet.engine_rpm)
     
     # Fuel consumption based on speed and RPM
-    fuel_consumption_rate = (state["speed"] * 0.001 + state["engine_rpm"] * 0.0001) * time_diff
-    state["fuel_level"] = max(0, state["fuel_level"] - fuel_consumption_rate)
+    fuel_consumption_rate = (fleet.speed * 0.001 + fleet.engine_rpm * 0.0001) * time_diff
+    np.maximum(fleet.fuel_level - fuel_consumption_rate, 0, out=fleet.fuel_level)
     
     # Engine temperature simulation
-    temp_target = 90 + (state["engine_rpm"] - 2000) * 0.005
-    temp_change = (temp_target - state["engine_temperature"]) * 0.1 * time_diff
-    state["engine_temperature"] = max(70, min(120, state["engine_temperature"] + temp_change))
+    temp_target = 90 + (fleet.engine_rpm - 2000) * 0.005
+    temp_change = (temp_target - fleet.engine_temperature) * 0.1 * time_diff
+    np.clip(fleet.engine_temperature + temp_change, 70, 120, out=fleet.engine_temperature)
     
     # GPS movement simulation
-    movement_distance = state["speed"] * time_diff / 3600 / 111  # rough degree conversion
-    angle_rad = math.radians(state["direction"])
-    state["latitude"] += movement_distance * math.cos(angle_rad)
-    state["longitude"] += movement_distance * math.sin(angle_rad)
+    movement_distance = fleet.speed * time_diff / 3600 / 111  # rough degree conversion
+    fleet.latitude += movement_distance * fleet.cos_dir
+    fleet.longitude += movement_distance * fleet.sin_dir
     
-    # Occasional direction changes
-    if random.random() < 0.1:
-        state["direction"] += random.uniform(-30, 30)
-        state["direction"] = state["direction"] % 360
+    # Occasional direction changes; trig is only recomputed for vehicles that turned
+    turning = draws[:, 2] < -0.8  # 10% chance
+    fleet.direction[turning] = (fleet.direction[turning] + draws[turning, 3] * 30) % 360
+    angle_rad = np.radians(fleet.direction[turning])
+    fleet.cos_dir[turning] = np.cos(angle_rad)
+    fleet.sin_dir[turning] = np.sin(angle_rad)
     
-    state["last_update"] = current_time
+    fleet.last_update[:] = current_time.timestamp()
     
-    return TelemetryData(
-        vehicle_id=vehicle_id,
-        speed=round(state["speed"], 1),
-        engine_rpm=round(state["engine_rpm"], 0),
-        fuel_level=round(state["fuel_level"], 1),
-        engine_temperature=round(state["engine_temperature"], 1),
-        latitude=round(state["latitude"], 6),
-        longitude=round(state["longitude"], 6),
-        timestamp=current_time
-    )
+    # Plain dicts shaped like TelemetryData; trusted simulator output skips model validation
+    return [
+        {
+            "vehicle_id": vehicle_id,
+            "speed": speed,
+            "engine_rpm": engine_rpm,
+            "fuel_level": fuel_level,
+            "engine_temperature": engine_temperature,
+            "latitude": latitude,
+            "longitude": longitude,
+            "timestamp": current_time
+        }
+        for vehicle_id, speed, engine_rpm, fuel_level, engine_temperature, latitude, longitude in zip(
+            fleet.ids,
+            np.round(fleet.speed, TELEMETRY_PRECISION["speed"]).tolist(),
+            np.round(fleet.engine_rpm, TELEMETRY_PRECISION["engine_rpm"]).tolist(),
+            np.round(fleet.fuel_level, TELEMETRY_PRECISION["fuel_level"]).tolist(),
+            np.round(fleet.engine_temperature, TELEMETRY_PRECISION["engine_temperature"]).tolist(),
+            np.round(fleet.latitude, TELEMETRY_PRECISION["latitude"]).tolist(),
+            np.round(fleet.longitude, TELEMETRY_PRECISION["longitude"]).tolist()
+        )
+    ]
 
-def check_telemetry_alerts(telemetry: TelemetryData) -> List[TelemetryAlert]:
-    """Check telemetry data against thresholds and generate alerts"""
+def check_telemetry_alerts(fleet: VehicleFleet) -> List[TelemetryAlert]:
+    """Check telemetry data of every vehicle against thresholds and return new alert events"""
     alerts = []
     
-    for metric, thresholds in TELEMETRY_THRESHOLDS.items():
-        value = getattr(telemetry, metric)
+    # (N, metrics) matrix of the reported (rounded) readings
+    values = np.column_stack([
+        np.round(getattr(fleet, metric), TELEMETRY_PRECISION[metric]) for metric in ALERT_METRICS
+    ])
+    over = values > THRESH_MAX
+    under = values < THRESH_MIN
+    
+    now = time.time()
+    breached = set()
+    
+    # Only vehicles/metrics outside their thresholds reach Python-level code
+    for row, col in zip(*np.nonzero(over | under)):
+        metric = ALERT_METRICS[col]
+        key = (fleet.ids[row], metric)
+        breached.add(key)
+        if key in _alert_state and now - _alert_state[key] < ALERT_COOLDOWN_SECONDS:
+            continue
         
-        if value > thresholds["max"]:
+        thresholds = TELEMETRY_THRESHOLDS[metric]
+        value = values[row, col].item()
+        
+        if over[row, col]:
             severity = "high" if value > thresholds["max"] * 1.2 else "medium"
-            alerts.append(TelemetryAlert(
-                vehicle_id=telemetry.vehicle_id,
+            alert = TelemetryAlert(
+                vehicle_id=fleet.ids[row],
                 metric=metric,
                 value=value,
                 threshold=thresholds["max"],
                 severity=severity,
                 message=f"{metric.replace('_', ' ').title()} is critically high: {value}"
-            ))
-        elif value < thresholds["min"]:
+            )
+        else:
             severity = "high" if value < thresholds["min"] * 0.8 else "medium"
-            alerts.append(TelemetryAlert(
-                vehicle_id=telemetry.vehicle_id,
+            alert = TelemetryAlert(
+                vehicle_id=fleet.ids[row],
                 metric=metric,
                 value=value,
                 threshold=thresholds["min"],
                 severity=severity,
                 message=f"{metric.replace('_', ' ').title()} is critically low: {value}"
-            ))
+            )
+        
+        _alert_state[key] = now
+        active_alerts[key] = alert
+        alerts.append(alert)
+    
+    # Metrics back within thresholds re-fire on their next breach
+    for key in [key for key in _alert_state if key not in breached]:
+        del _alert_state[key]
+        del active_alerts[key]
     
     return alerts
 
@@ -202,17 +411,17 @@ async def create_vehicle(vehicle_data: VehicleCreate):
     
     # Store in database
     result = await db.vehicles.insert_one(vehicle.dict())
+    invalidate_vehicle_cache()
     
     # Initialize simulation state
-    vehicle_states[vehicle.id] = initialize_vehicle_state(vehicle.id)
+    vehicle_fleet.add(vehicle.id)
     
     return vehicle
 
-@api_router.get("/vehicles", response_model=List[Vehicle])
+@api_router.get("/vehicles", response_model=None)
 async def get_vehicles():
     """Get all vehicles"""
-    vehicles = await db.vehicles.find({"is_active": True}).to_list(100)
-    return [Vehicle(**vehicle) for vehicle in vehicles]
+    return await db.vehicles.find({"is_active": True}, projection=VEHICLE_PROJECTION).to_list(100)
 
 @api_router.get("/vehicles/{vehicle_id}", response_model=Vehicle)
 async def get_vehicle(vehicle_id: str):
@@ -235,6 +444,7 @@ async def update_vehicle(vehicle_id: str, vehicle_data: VehicleCreate):
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Vehicle not found")
+    invalidate_vehicle_cache()
     
     updated_vehicle = await db.vehicles.find_one({"id": vehicle_id})
     return Vehicle(**updated_vehicle)
@@ -249,107 +459,119 @@ async def delete_vehicle(vehicle_id: str):
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Vehicle not found")
+    invalidate_vehicle_cache()
     
     # Remove from simulation
-    if vehicle_id in vehicle_states:
-        del vehicle_states[vehicle_id]
+    vehicle_fleet.remove(vehicle_id)
     
     return {"message": "Vehicle deleted successfully"}
 
-@api_router.get("/vehicles/{vehicle_id}/telemetry")
-async def get_vehicle_telemetry(vehicle_id: str, limit: int = 100):
+@api_router.get(
+    "/vehicles/{vehicle_id}/telemetry",
+    response_model=None,
+    responses={200: {"model": List[TelemetryData]}}  # documented only; stored documents aren't re-validated
+)
+async def get_vehicle_telemetry(vehicle_id: str, limit: int = Query(100, ge=1, le=10000)):
     """Get historical telemetry data for a vehicle"""
-    telemetry_data = await db.telemetry.find(
-        {"vehicle_id": vehicle_id}
-    ).sort("timestamp", -1).limit(limit).to_list(limit)
-    
-    return [TelemetryData(**data) for data in telemetry_data]
+    pipeline = [
+        {"$match": {"vehicle_id": vehicle_id}},
+        {"$sort": {"timestamp": -1}},
+        {"$limit": limit},
+        {"$project": TELEMETRY_PROJECTION}
+    ]
+    # aggregate() passes hint through unconverted, so it must be a key document, not a list of pairs
+    return await telemetry_coll.aggregate(pipeline, hint=dict(TELEMETRY_INDEX)).to_list(limit)
 
 @api_router.get("/vehicles/{vehicle_id}/telemetry/export")
-async def export_vehicle_telemetry(vehicle_id: str, days: int = 7):
+async def export_vehicle_telemetry(vehicle_id: str, days: int = Query(7, ge=0, le=3650)):
     """Export telemetry data as CSV"""
-    from_date = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - pd.Timedelta(days=days)
+    from_date = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
     
-    telemetry_data = await db.telemetry.find({
+    query = {
         "vehicle_id": vehicle_id,
         "timestamp": {"$gte": from_date}
-    }).sort("timestamp", 1).to_list(10000)
+    }
     
-    if not telemetry_data:
+    if not await telemetry_coll.find_one(query, projection={"_id": 1}):
         raise HTTPException(status_code=404, detail="No telemetry data found")
     
-    # Convert to DataFrame
-    df = pd.DataFrame([
-        {
-            "timestamp": data["timestamp"],
-            "vehicle_id": data["vehicle_id"],
-            "speed_kmh": data["speed"],
-            "engine_rpm": data["engine_rpm"],
-            "fuel_level_percent": data["fuel_level"],
-            "engine_temperature_celsius": data["engine_temperature"],
-            "latitude": data["latitude"],
-            "longitude": data["longitude"]
-        }
-        for data in telemetry_data
-    ])
-    
-    # Convert to CSV
-    csv_buffer = io.StringIO()
-    df.to_csv(csv_buffer, index=False)
-    csv_content = csv_buffer.getvalue()
-    
-    def generate_csv():
-        yield csv_content
+    async def generate_csv() -> AsyncGenerator[str, None]:
+        # Stream rows straight from the cursor instead of materializing the export
+        line = io.StringIO()
+        writer = csv.writer(line, lineterminator="\n")
+        
+        def format_row(values: list) -> str:
+            line.seek(0)
+            line.truncate()
+            writer.writerow(values)
+            return line.getvalue()
+        
+        yield format_row([
+            "timestamp", "vehicle_id", "speed_kmh", "engine_rpm", "fuel_level_percent",
+            "engine_temperature_celsius", "latitude", "longitude"
+        ])
+        cursor = telemetry_coll.find(
+            query, projection=TELEMETRY_PROJECTION, batch_size=EXPORT_BATCH_SIZE
+        ).sort("timestamp", 1)
+        async for data in cursor:
+            yield format_row([
+                data["timestamp"].isoformat(), data["vehicle_id"], data["speed"], data["engine_rpm"],
+                data["fuel_level"], data["engine_temperature"], data["latitude"], data["longitude"]
+            ])
     
     return StreamingResponse(
-        io.BytesIO(csv_content.encode()),
+        generate_csv(),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=telemetry_{vehicle_id}_{days}days.csv"}
     )
 
-# WebSocket endpoint for real-time telemetry
-@app.websocket("/ws/telemetry")
-async def websocket_telemetry(websocket: WebSocket):
-    await manager.connect(websocket)
-    try:
-        while True:
+async def telemetry_producer():
+    """Simulate, store and broadcast telemetry for all active vehicles once per second"""
+    while True:
+        try:
+            # Get active vehicles
+            vehicles = await get_active_vehicles()
+            
+            # Initialize state for new vehicles and drop inactive ones
+            vehicle_fleet.sync([vehicle_data["id"] for vehicle_data in vehicles])
+            
             # Generate telemetry for all active vehicles
-            all_telemetry = []
-            all_alerts = []
+            all_telemetry = simulate_batch(vehicle_fleet)
             
-            # Get active vehicles
-            vehicles = await db.vehicles.find({"is_active": True}).to_list(100)
+            # Check for alerts
+            all_alerts = check_telemetry_alerts(vehicle_fleet)
             
-            for vehicle_data in vehicles:
-                vehicle_id = vehicle_data["id"]
-                
-                # Initialize state if not exists
-                if vehicle_id not in vehicle_states:
-                    vehicle_states[vehicle_id] = initialize_vehicle_state(vehicle_id)
-                
-                # Generate telemetry
-                telemetry = simulate_realistic_telemetry(vehicle_id, vehicle_states[vehicle_id])
-                
-                # Store in database (optional, for historical data)
-                await db.telemetry.insert_one(telemetry.dict())
-                
-                # Check for alerts
-                alerts = check_telemetry_alerts(telemetry)
-                all_alerts.extend(alerts)
-                
-                all_telemetry.append(telemetry.dict())
+            # Queue for batched storage (optional, for historical data); copies,
+            # since insert_many adds an _id to each document
+            buffer_telemetry([dict(telemetry) for telemetry in all_telemetry])
             
             # Send data to all connected clients
             message = {
                 "type": "telemetry_update",
-                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "timestamp": datetime.now(timezone.utc),
                 "data": all_telemetry,
                 "alerts": [alert.dict() for alert in all_alerts]
             }
             
             await manager.broadcast(message)
-            await asyncio.sleep(1)  # Update every second
-            
+        except Exception:
+            logger.exception("Telemetry producer tick failed")
+        
+        await asyncio.sleep(1)  # Update every second
+
+# WebSocket endpoint for real-time telemetry
+@app.websocket("/ws/telemetry")
+async def websocket_telemetry(websocket: WebSocket):
+    await manager.connect(websocket)
+    # Alert events are throttled, so start new clients with the ongoing ones
+    manager.send(websocket, {
+        "type": "alert_snapshot",
+        "alerts": [alert.dict() for alert in active_alerts.values()]
+    })
+    try:
+        # Updates are pushed by telemetry_producer(); just hold the socket open
+        while True:
+            await websocket.receive_text()
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
@@ -367,10 +589,40 @@ app.add_middleware(
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelevel)s - %(message)s'
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    # Acknowledged handle so index build failures are reported
+    await db.telemetry.create_index(TELEMETRY_INDEX)
+    await db.vehicles.create_index([("id", 1)], unique=True)
+    await db.vehicles.create_index([("is_active", 1)])
+
+flush_task: Optional[asyncio.Task] = None
+producer_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_telemetry_flusher():
+    global flush_task
+    flush_task = asyncio.create_task(flush_loop())
+
+@app.on_event("startup")
+async def start_telemetry_producer():
+    global producer_task
+    producer_task = asyncio.create_task(telemetry_producer())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if producer_task:
+        producer_task.cancel()
+        await asyncio.gather(producer_task, return_exceptions=True)
+    if flush_task:
+        # Stop the flusher cooperatively so an in-flight insert_many is never cancelled;
+        # its last pass writes whatever the producer buffered
+        telemetry_flush_stop.set()
+        telemetry_flush_event.set()
+        await flush_task
+    await flush_telemetry_buffer()
     client.close()
\ No newline at end of file
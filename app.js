@@ -74,8 +74,26 @@ const Dashboard = () => {
           });
           setTelemetryData(newTelemetryData);
           
-          // Update alerts
-          setAlerts(message.alerts || []);
+          // Update alerts: the server only re-sends an ongoing alert after its
+          // cooldown, so keep each one until its metric is back within threshold
+          setAlerts(prev => {
+            const active = {};
+            prev.forEach(alert => {
+              const current = newTelemetryData[alert.vehicle_id];
+              if (!current) return;
+              const value = current[alert.metric];
+              const recovered = alert.value > alert.threshold
+                ? value <= alert.threshold
+                : value >= alert.threshold;
+              if (!recovered) {
+                active[`${alert.vehicle_id}:${alert.metric}`] = alert;
+              }
+            });
+            (message.alerts || []).forEach(alert => {
+              active[`${alert.vehicle_id}:${alert.metric}`] = alert;
+            });
+            return Object.values(active);
+          });
           
           // Update historical data for charts
           setHistoricalData(prev => {
@@ -89,6 +107,9 @@ const Dashboard = () => {
             // Keep only last 50 data points for performance
             return newData.slice(-50);
           });
+        } else if (message.type === 'alert_snapshot') {
+          // Ongoing alerts sent once on connect
+          setAlerts(message.alerts || []);
         }
       };
       